@@ -0,0 +1,85 @@
+"""
+Benchmark the thread backend of the capture.
+
+Times a small capture for a growing number of threads and prints the speedup
+compared to a single thread. This is done without the irradiance cache, with
+one cache shared by all threads ("capture" mode) and with a cache per thread
+("worker" mode). Run it with a regular and a free-threaded (3.13t)
+Python to get the scaling curve of both builds. The maximum number of threads
+can be given as an argument, by default it is the number of CPUs.
+"""
+
+import os
+import sys
+import time
+
+from src.camera import Camera
+from src.scene import Scene
+from src.scene_objects import SceneObject, Sphere
+from src.utils import is_gil_enabled
+from src.vector import Vector
+
+RESOLUTION = 32
+
+
+def make_scene() -> Scene:
+    """Wide scene with a grid of small spheres on a large ground sphere."""
+    camera = Camera(
+        eye_position=Vector(5, 0, 1),
+        window_size_x=1,
+        window_size_y=1,
+        viewing_direction=Vector(-1, 0, -0.1),
+        orientation_vector=Vector(-0.1, 0, 1),
+        window_distance=1,
+    )
+
+    scene_objects: list[SceneObject] = []
+    for ind_x in range(4):
+        for ind_y in range(9):
+            scene_objects.append(
+                Sphere(
+                    center=Vector(-ind_x * 1.5, (ind_y - 4) * 1.2, 0),
+                    radius=0.3,
+                    color=Vector(40 + 50 * ind_x, 240 - 20 * ind_y, 31),
+                    roughness=(ind_x + ind_y) % 2,
+                )
+            )
+    scene_objects.append(
+        Sphere(
+            center=Vector(0, 0, -10000),
+            radius=9999.7,
+            color=Vector(129, 72, 176),
+            roughness=1,
+        )
+    )
+
+    return Scene(camera=camera, scene_objects=scene_objects, light_sources=[])
+
+
+if __name__ == "__main__":
+    """Print the capture time and speedup for each number of threads."""
+    build = "GIL" if is_gil_enabled() else "free-threaded"
+    print(f"Python {sys.version.split()[0]} ({build}), {RESOLUTION}x{RESOLUTION}")
+
+    max_threads = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1
+    scene = make_scene()
+    thread_counts = [1]
+    while thread_counts[-1] * 2 <= max_threads:
+        thread_counts.append(thread_counts[-1] * 2)
+
+    for cache_mode in (None, "capture", "worker"):
+        print(f"\nIrradiance cache: {cache_mode or 'off'}")
+        scene.use_irradiance_cache = cache_mode is not None
+        if cache_mode is not None:
+            scene.irradiance_cache_mode = cache_mode
+
+        base_time = None
+        for num_threads in thread_counts:
+            start = time.perf_counter()
+            scene.capture_with_threads(RESOLUTION, RESOLUTION, num_threads)
+            elapsed = time.perf_counter() - start
+            if base_time is None:
+                base_time = elapsed
+            speedup = base_time / elapsed
+            bar = "#" * round(speedup * 10)
+            print(f"{num_threads:3d} threads {elapsed:8.2f}s {speedup:5.2f}x {bar}")
@@ -10,3 +10,17 @@ BETTER_RANDOM_BOUNCE = True
 NUMERICAL_FIX_COLLISION_POINT = True
 DEFAULT_COLOR_MIXING_METHOD = "multiply"
 USE_ANTIALIASING = True
+USE_TILE_BINNING = True
+TILE_SIZE = 16  # in pixels, for binning objects on the camera window
+USE_IRRADIANCE_CACHE = False
+# "capture" uses a new cache for each capture, "shared" keeps one cache on the scene,
+# "worker" uses a new cache for each worker thread of a capture
+IRRADIANCE_CACHE_MODE = "capture"
+IRRADIANCE_CACHE_MIN_ROUGHNESS = 1  # only cache at hits at least this rough
+IRRADIANCE_CACHE_CELL_SIZE = 0.2
+IRRADIANCE_CACHE_MAX_DISTANCE = 0.2  # must not be larger than the cell size
+IRRADIANCE_CACHE_MIN_NORMAL_DOT = 0.95
+IRRADIANCE_CACHE_MIN_SAMPLES = 16  # samples a record needs before it is used
+IRRADIANCE_CACHE_MAX_RECORDS = 200000
+# "serial" or "threads", the latter only runs in parallel on free-threaded Python
+DEFAULT_CAPTURE_BACKEND = "serial"
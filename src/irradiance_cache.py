@@ -0,0 +1,168 @@
+"""Module containing a cache for the indirect color at diffuse hits."""
+
+import math
+import threading
+from collections import OrderedDict
+
+from src.vector import Vector, dot
+
+
+class CacheRecord:
+    """Running average of the indirect color seen from a point with a normal."""
+
+    def __init__(self, position: Vector, normal: Vector) -> None:
+        """Create an empty record."""
+        self.position = position
+        self.normal = normal
+        self.color_sum = Vector(0, 0, 0)
+        self.num_samples = 0
+
+    def add_sample(self, color: Vector) -> None:
+        """Add a color estimate to the average."""
+        self.color_sum += color
+        self.num_samples += 1
+
+    def get_color(self) -> Vector:
+        """Get the average color."""
+        return self.color_sum * (1 / self.num_samples)
+
+
+class IrradianceCache:
+    """
+    Spatial hash grid of indirect color estimates.
+
+    On a diffuse surface the bounce direction does not depend on the incoming ray,
+    so the color coming back from the bounce changes slowly over the surface. Each
+    record averages the colors of the paths traced from near its position and,
+    once it has enough samples, nearby hits with a similar normal interpolate the
+    records instead of tracing a path.
+
+    Records are kept in grid cells keyed by position. When there are too many
+    records the least recently used cells are evicted. All operations take a lock
+    so the cache can be shared by multiple workers.
+    """
+
+    def __init__(
+        self,
+        cell_size: float,
+        max_distance: float,
+        min_normal_dot: float,
+        min_samples: int,
+        max_records: int,
+    ) -> None:
+        """Create an empty cache."""
+        assert 0 < max_distance <= cell_size, (
+            "Max distance must be positive and not larger than the cell size"
+        )
+        assert min_samples > 0
+        assert max_records > 0
+        self.cell_size = cell_size
+        self.max_distance = max_distance
+        self.min_normal_dot = min_normal_dot
+        self.min_samples = min_samples
+        self.max_records = max_records
+
+        self.cells: OrderedDict[tuple[int, int, int], list[CacheRecord]] = (
+            OrderedDict()
+        )
+        self.num_records = 0
+        self.lock = threading.Lock()
+
+    def get_cell_key(self, position: Vector) -> tuple[int, int, int]:
+        """Get the key of the cell containing a position."""
+        return (
+            math.floor(position.x / self.cell_size),
+            math.floor(position.y / self.cell_size),
+            math.floor(position.z / self.cell_size),
+        )
+
+    def lookup(self, position: Vector, normal: Vector) -> Vector | None:
+        """
+        Interpolate the color of the usable records close to the position, or
+        return None if there are none.
+
+        Records are weighted by how close they are, both in position and normal.
+        Since the max distance is at most the cell size, only the cell and its
+        direct neighbours need to be checked. The lock is only held to copy the
+        usable records, the weighting happens without it.
+        """
+        key_x, key_y, key_z = self.get_cell_key(position)
+        usable_records: list[tuple[Vector, Vector, Vector]] = []
+        with self.lock:
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for dz in (-1, 0, 1):
+                        records = self.cells.get((key_x + dx, key_y + dy, key_z + dz))
+                        if records is None:
+                            continue
+                        for record in records:
+                            if record.num_samples >= self.min_samples:
+                                usable_records.append(
+                                    (record.position, record.normal, record.get_color())
+                                )
+            # mark as recently used
+            if usable_records and (key_x, key_y, key_z) in self.cells:
+                self.cells.move_to_end((key_x, key_y, key_z))
+
+        weighted_color = Vector(0, 0, 0)
+        total_weight = 0.0
+        for record_position, record_normal, record_color in usable_records:
+            normal_dot = dot(normal, record_normal)
+            if normal_dot < self.min_normal_dot:
+                continue
+            distance = (position - record_position).magnitude()
+            if distance > self.max_distance:
+                continue
+            weight = 1 / (
+                distance / self.max_distance
+                + math.sqrt(max(0.0, 1 - normal_dot))
+                + 1e-3
+            )
+            weighted_color += record_color * weight
+            total_weight += weight
+
+        if total_weight == 0:
+            return None
+        return weighted_color * (1 / total_weight)
+
+    def add_sample(self, position: Vector, normal: Vector, color: Vector) -> None:
+        """
+        Add a color estimate to the closest matching record in the cell of the
+        position. Records are spaced half the max distance apart, a new one is made
+        if none is close enough.
+
+        The closest record is searched for in a copy of the cell without holding
+        the lock. If another worker adds a close record in the meantime, both are
+        kept.
+        """
+        key = self.get_cell_key(position)
+        with self.lock:
+            records = list(self.cells.get(key, []))
+
+        closest_record = None
+        closest_distance = self.max_distance / 2
+        for record in records:
+            if dot(normal, record.normal) < self.min_normal_dot:
+                continue
+            distance = (position - record.position).magnitude()
+            if distance <= closest_distance:
+                closest_record = record
+                closest_distance = distance
+
+        with self.lock:
+            if closest_record is None:
+                closest_record = CacheRecord(position, normal)
+                self.cells.setdefault(key, []).append(closest_record)
+                self.num_records += 1
+            # the cell may have been evicted since the copy, then the sample is lost
+            if key in self.cells:
+                self.cells.move_to_end(key)
+            closest_record.add_sample(color)
+            self.evict()
+
+    def evict(self) -> None:
+        """Drop least recently used cells until the record count is within the
+        limit. Expects the lock to be held."""
+        while self.num_records > self.max_records and len(self.cells) > 1:
+            _, records = self.cells.popitem(last=False)
+            self.num_records -= len(records)
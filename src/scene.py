@@ -1,6 +1,8 @@
 """Module containing the scene with rendering methods."""
 
 import math
+import os
+from concurrent.futures import ThreadPoolExecutor
 
 from src.camera import Camera
 from src.constants import (
@@ -12,11 +14,29 @@ from src.constants import (
     USE_ANTIALIASING,
     SAMPLES_PER_PIXEL,
     FILTER_RADIUS,
+    USE_TILE_BINNING,
+    TILE_SIZE,
+    USE_IRRADIANCE_CACHE,
+    IRRADIANCE_CACHE_MODE,
+    IRRADIANCE_CACHE_MIN_ROUGHNESS,
+    IRRADIANCE_CACHE_CELL_SIZE,
+    IRRADIANCE_CACHE_MAX_DISTANCE,
+    IRRADIANCE_CACHE_MIN_NORMAL_DOT,
+    IRRADIANCE_CACHE_MIN_SAMPLES,
+    IRRADIANCE_CACHE_MAX_RECORDS,
+    DEFAULT_CAPTURE_BACKEND,
 )
+from src.irradiance_cache import IrradianceCache
 from src.scene_objects import SceneObject
 from src.light_source import LightSource
 from src.simple_image import SimpleImage
-from src.utils import get_random_point_on_unit_disk
+from src.tile_bins import TileBins
+from src.utils import (
+    AtomicCounter,
+    get_random_point_on_unit_disk,
+    is_gil_enabled,
+    seed_rng,
+)
 from src.vector import (
     Vector,
     reflect_around,
@@ -40,24 +60,39 @@ class Scene:
         self.camera = camera
         self.scene_objects = scene_objects
         self.light_sources = light_sources
+        self.use_irradiance_cache = USE_IRRADIANCE_CACHE
+        self.irradiance_cache_mode = IRRADIANCE_CACHE_MODE
+        self.irradiance_cache: IrradianceCache | None = None
 
     def send_ray(
-        self, p: Vector, v: Vector, t_min: float, t_max: float
+        self,
+        p: Vector,
+        v: Vector,
+        t_min: float,
+        t_max: float,
+        candidate_indices: list[int] | None = None,
     ) -> tuple[float, int | None]:
         """
         Send a ray from point p in direction v and check for collision with any
         objects between t_min and t_max. Pick closest point of collision. Return the
         t of the collision and the index of the object.
+
+        If candidate indices are given, only those objects are checked.
         """
-        # check collision with all objects
+        if candidate_indices is None:
+            candidate_indices = list(range(len(self.scene_objects)))
+
+        # check collision with candidate objects
         distances = []
-        for scene_object in self.scene_objects:
-            distances.append(scene_object.intersect_ray(p, v, t_min, t_max))
+        for ind in candidate_indices:
+            distances.append(
+                (ind, self.scene_objects[ind].intersect_ray(p, v, t_min, t_max))
+            )
 
         # find closest object
         min_distance = math.inf
         min_index = None
-        for ind, distance in enumerate(distances):
+        for ind, distance in distances:
             if distance is not None and distance < min_distance:
                 min_distance = distance
                 min_index = ind
@@ -112,14 +147,30 @@ class Scene:
 
         return result
 
-    def get_ray_color(self, starting_point: Vector, ray_direction: Vector) -> Vector:
-        """Given a ray (p and v), get the color that it observes."""
+    def get_ray_color(
+        self,
+        starting_point: Vector,
+        ray_direction: Vector,
+        primary_candidates: list[int] | None = None,
+        irradiance_cache: IrradianceCache | None = None,
+    ) -> Vector:
+        """Given a ray (p and v), get the color that it observes.
+
+        Primary candidates limit the objects checked for the first collision, the
+        bounces always check all objects.
+
+        If an irradiance cache is given, the color coming into rough enough hits is
+        taken from the cache when possible. Otherwise the path is traced and the
+        color it found after the hit is added to the cache."""
         observed_colors: list[Vector] = []
+        candidates = primary_candidates
+        # index in observed colors, position and normal of hits to add to the cache
+        uncached_hits: list[tuple[int, Vector, Vector]] = []
 
         for _ in range(MAX_NUMBER_OF_BOUNCES):
             # find next collision
             t, object_index = self.send_ray(
-                starting_point, ray_direction, TOLERANCE, math.inf
+                starting_point, ray_direction, TOLERANCE, math.inf, candidates
             )  # TODO for the first ray t_min should be 1, otherwise collision may be inside camera
 
             # add color to list
@@ -129,6 +180,7 @@ class Scene:
                 break
             collided_object = self.scene_objects[object_index]
             observed_colors.append(collided_object.color)
+            candidates = None
 
             # calculate next starting point
             collision_point = starting_point + t * ray_direction
@@ -139,6 +191,19 @@ class Scene:
             else:
                 starting_point = collision_point
 
+            if (
+                irradiance_cache is not None
+                and collided_object.roughness >= IRRADIANCE_CACHE_MIN_ROUGHNESS
+            ):
+                cached_color = irradiance_cache.lookup(collision_point, unit_normal)
+                if cached_color is not None:
+                    # cached color stands in for the rest of the path
+                    observed_colors.append(cached_color)
+                    break
+                uncached_hits.append(
+                    (len(observed_colors) - 1, collision_point, unit_normal)
+                )
+
             # calculate next direction depending on object roughness
             clean_bounce = reflect_around(-ray_direction, unit_normal)
             random_bounce = random_vector_in_hemisphere(unit_normal)
@@ -146,71 +211,244 @@ class Scene:
                 clean_bounce, random_bounce, collided_object.roughness
             )
 
+        for color_index, position, normal in uncached_hits:
+            incoming_colors = observed_colors[color_index + 1 :]
+            if incoming_colors:
+                irradiance_cache.add_sample(
+                    position, normal, self.calculate_color(incoming_colors)
+                )
+
         return self.calculate_color(observed_colors)
 
-    def capture(
-        self, resolution_x: int, resolution_y: int, verbose: bool = False
-    ) -> SimpleImage:
+    def get_irradiance_caches(
+        self, num_workers: int
+    ) -> list[IrradianceCache | None]:
+        """Get the irradiance cache of each worker of a capture, depending on the
+        mode. "capture" and "shared" give all workers the same cache, "worker"
+        gives each worker its own."""
+        if not self.use_irradiance_cache:
+            return [None] * num_workers
+        if self.irradiance_cache_mode == "capture":
+            return [self.make_irradiance_cache()] * num_workers
+        elif self.irradiance_cache_mode == "shared":
+            if self.irradiance_cache is None:
+                self.irradiance_cache = self.make_irradiance_cache()
+            return [self.irradiance_cache] * num_workers
+        elif self.irradiance_cache_mode == "worker":
+            return [self.make_irradiance_cache() for _ in range(num_workers)]
+        else:
+            raise Exception("Invalid irradiance cache mode")
+
+    def make_irradiance_cache(self) -> IrradianceCache:
+        """Create an empty irradiance cache with the configured settings."""
+        return IrradianceCache(
+            cell_size=IRRADIANCE_CACHE_CELL_SIZE,
+            max_distance=IRRADIANCE_CACHE_MAX_DISTANCE,
+            min_normal_dot=IRRADIANCE_CACHE_MIN_NORMAL_DOT,
+            min_samples=IRRADIANCE_CACHE_MIN_SAMPLES,
+            max_records=IRRADIANCE_CACHE_MAX_RECORDS,
+        )
+
+    def get_pixel_color(
+        self,
+        i: int,
+        j: int,
+        pixel_size_x: float,
+        pixel_size_y: float,
+        tile_bins: TileBins | None,
+        irradiance_cache: IrradianceCache | None,
+    ) -> Vector:
+        """Get the color of pixel (i, j) by sending rays through it."""
+        primary_candidates = (
+            tile_bins.get_candidates(i, j) if tile_bins is not None else None
+        )
+
+        pixel_center = (
+            self.camera.top_left
+            - ((i + 0.5) * 2 * pixel_size_x * self.camera.up_unit)
+            + ((j + 0.5) * 2 * pixel_size_y * self.camera.right_unit)
+        )
+
+        if USE_ANTIALIASING:
+            samples: list[Vector] = []
+            for _ in range(SAMPLES_PER_PIXEL):
+                starting_point = self.camera.eye_position
+
+                offset_value = get_random_point_on_unit_disk()
+                offset_position = (
+                    pixel_center
+                    + offset_value[0]
+                    * FILTER_RADIUS
+                    * pixel_size_x
+                    * self.camera.up_unit
+                    + offset_value[1]
+                    * FILTER_RADIUS
+                    * pixel_size_y
+                    * self.camera.right_unit
+                )
+
+                ray_direction = offset_position - self.camera.eye_position
+                samples.append(
+                    self.get_ray_color(
+                        starting_point,
+                        ray_direction,
+                        primary_candidates,
+                        irradiance_cache,
+                    )
+                )
+
+            # get average
+            pixel_color = Vector(0, 0, 0)
+            for sample in samples:
+                pixel_color += sample
+            return pixel_color * (1 / len(samples))
+
+        starting_point = self.camera.eye_position
+        ray_direction = pixel_center - self.camera.eye_position
+        return self.get_ray_color(
+            starting_point, ray_direction, primary_candidates, irradiance_cache
+        )
+
+    def render_rows(
+        self,
+        pixels: list[list[Vector]],
+        row_counter: AtomicCounter,
+        tile_bins: TileBins | None,
+        irradiance_cache: IrradianceCache | None,
+        verbose: bool,
+        seed: int | None = None,
+    ) -> None:
         """
-        Capture the scene with a given resolution.
+        Claim rows from the counter and write their colors into the pixels until
+        there are no rows left.
 
-        x is top to bottom, y is left to right.
+        Every row is claimed exactly once, so multiple threads can work on the same
+        pixels without locking.
+
+        If a seed is given, the random generator of the thread is seeded from it
+        and the row index before each row, so the rows do not depend on which
+        thread renders them.
         """
-        assert resolution_x > 0
-        assert resolution_y > 0
-        pixels = []
+        resolution_x = len(pixels)
+        resolution_y = len(pixels[0])
         pixel_size_x = self.camera.window_size_x / resolution_x
         pixel_size_y = self.camera.window_size_y / resolution_y
-        for i in range(resolution_x):
+        while True:
+            i = row_counter.next()
+            if i >= resolution_x:
+                return
             if verbose and (i + 1) % 10 == 0:
                 print(f"Rendering row {i + 1} of {resolution_x}")
-            row = []
+            if seed is not None:
+                seed_rng(seed * resolution_x + i)
+            row = pixels[i]
             for j in range(resolution_y):
-                if not self.scene_objects:
-                    row.append(Vector(*BACKGROUND_COLOR))
-                    continue
-
-                pixel_center = (
-                    self.camera.top_left
-                    - ((i + 0.5) * 2 * pixel_size_x * self.camera.up_unit)
-                    + ((j + 0.5) * 2 * pixel_size_y * self.camera.right_unit)
+                row[j] = self.get_pixel_color(
+                    i, j, pixel_size_x, pixel_size_y, tile_bins, irradiance_cache
                 )
 
-                if USE_ANTIALIASING:
-                    samples: list[Vector] = []
-                    for _ in range(SAMPLES_PER_PIXEL):
-                        starting_point = self.camera.eye_position
-
-                        offset_value = get_random_point_on_unit_disk()
-                        offset_position = (
-                            pixel_center
-                            + offset_value[0]
-                            * FILTER_RADIUS
-                            * pixel_size_x
-                            * self.camera.up_unit
-                            + offset_value[1]
-                            * FILTER_RADIUS
-                            * pixel_size_y
-                            * self.camera.right_unit
-                        )
-
-                        ray_direction = offset_position - self.camera.eye_position
-                        samples.append(
-                            self.get_ray_color(starting_point, ray_direction)
-                        )
-
-                    # get average
-                    pixel_color = Vector(0, 0, 0)
-                    for sample in samples:
-                        pixel_color += sample
-                    pixel_color = pixel_color * (1 / len(samples))
-
-                else:
-                    starting_point = self.camera.eye_position
-                    ray_direction = pixel_center - self.camera.eye_position
-                    pixel_color = self.get_ray_color(starting_point, ray_direction)
-
-                row.append(pixel_color)
-
-            pixels.append(row)
+    def capture(
+        self,
+        resolution_x: int,
+        resolution_y: int,
+        verbose: bool = False,
+        backend: str = DEFAULT_CAPTURE_BACKEND,
+        num_threads: int | None = None,
+        seed: int | None = None,
+    ) -> SimpleImage:
+        """
+        Capture the scene with a given resolution.
+
+        x is top to bottom, y is left to right.
+
+        The "serial" backend renders everything in the calling thread and does not
+        take a number of threads. The "threads" backend renders rows in a pool of
+        num_threads threads (by default one per CPU), which only pays off on
+        free-threaded Python, so it falls back to serial when the GIL is enabled
+        and num_threads is ignored.
+        """
+        if backend == "serial":
+            assert num_threads is None or num_threads == 1, (
+                "Number of threads is only used by the threads backend"
+            )
+            num_threads = 1
+        elif backend == "threads":
+            if is_gil_enabled():
+                if verbose:
+                    print(
+                        "GIL is enabled, capturing serially instead of with "
+                        f"{num_threads or os.cpu_count() or 1} threads"
+                    )
+                num_threads = 1
+            elif num_threads is None:
+                num_threads = os.cpu_count() or 1
+        else:
+            raise Exception("Invalid capture backend")
+
+        return self.capture_with_threads(
+            resolution_x, resolution_y, num_threads, verbose, seed
+        )
+
+    def capture_with_threads(
+        self,
+        resolution_x: int,
+        resolution_y: int,
+        num_threads: int,
+        verbose: bool = False,
+        seed: int | None = None,
+    ) -> SimpleImage:
+        """
+        Capture the scene with rows rendered by a number of threads, whether the
+        GIL is enabled or not. With one thread everything happens in the calling
+        thread.
+
+        All threads write into the same pixels and share the scene, the tile bins
+        and (depending on the mode) the irradiance cache. Each thread has its own
+        random generator. Giving a seed makes the capture reproducible for any
+        number of threads, as long as the irradiance cache is off (the order in
+        which the cache is filled still depends on the threads).
+        """
+        assert resolution_x > 0
+        assert resolution_y > 0
+        assert num_threads > 0
+
+        # shared framebuffer, rows are filled in by whichever thread claims them
+        pixels = [
+            [Vector(*BACKGROUND_COLOR)] * resolution_y for _ in range(resolution_x)
+        ]
+        if not self.scene_objects:
+            return SimpleImage(pixels)
+
+        tile_bins = (
+            TileBins(
+                self.camera, self.scene_objects, resolution_x, resolution_y, TILE_SIZE
+            )
+            if USE_TILE_BINNING
+            else None
+        )
+        irradiance_caches = self.get_irradiance_caches(num_threads)
+        row_counter = AtomicCounter()
+
+        if num_threads == 1:
+            self.render_rows(
+                pixels, row_counter, tile_bins, irradiance_caches[0], verbose, seed
+            )
+        else:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                futures = [
+                    executor.submit(
+                        self.render_rows,
+                        pixels,
+                        row_counter,
+                        tile_bins,
+                        irradiance_cache,
+                        verbose,
+                        seed,
+                    )
+                    for irradiance_cache in irradiance_caches
+                ]
+                # raise errors from the threads
+                for future in futures:
+                    future.result()
+
         return SimpleImage(pixels)
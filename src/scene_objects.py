@@ -23,6 +23,11 @@ class SceneObject:
         """Get the unit normal of a point with respect to the object."""
         return Vector(0, 0, 0)
 
+    def get_bounding_sphere(self) -> tuple[Vector, float] | None:
+        """Get a sphere (center, radius) that fully contains the object, or None
+        if the object is unbounded."""
+        return None
+
 
 class Sphere(SceneObject):
     """Sphere represented by a center position and a radius."""
@@ -98,3 +103,7 @@ class Sphere(SceneObject):
         the sphere, it will be effectively projected on it.
         """
         return (p - self.center).unit()
+
+    def get_bounding_sphere(self) -> tuple[Vector, float] | None:
+        """A sphere is its own bounding sphere."""
+        return self.center, self.radius
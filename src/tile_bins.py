@@ -0,0 +1,136 @@
+"""Module for binning scene objects into tiles of the camera window."""
+
+import math
+
+from src.camera import Camera
+from src.constants import FILTER_RADIUS, USE_ANTIALIASING
+from src.scene_objects import SceneObject
+from src.vector import Vector, angle_between
+
+# slack on the angle comparison so rounding never drops a visible object
+ANGLE_SLACK = 1e-6
+
+
+class TileBins:
+    """
+    Per-tile lists of objects that primary rays can hit.
+
+    The window is split into square tiles of pixels. Seen from the eye, every
+    tile is covered by a cone through its corners and every bounded object by a
+    cone around its bounding sphere. An object is a candidate for a tile only if
+    the two cones overlap, so primary rays through a tile only need to be tested
+    against the candidates of that tile.
+
+    Objects without bounds, or with the eye inside their bounds, are candidates
+    for every tile.
+    """
+
+    def __init__(
+        self,
+        camera: Camera,
+        scene_objects: list[SceneObject],
+        resolution_x: int,
+        resolution_y: int,
+        tile_size: int,
+    ) -> None:
+        """Bin the objects for a capture with the given resolution."""
+        assert tile_size > 0
+        self.camera = camera
+        self.resolution_x = resolution_x
+        self.resolution_y = resolution_y
+        self.tile_size = tile_size
+        self.pixel_size_x = camera.window_size_x / resolution_x
+        self.pixel_size_y = camera.window_size_y / resolution_y
+
+        object_cones = [
+            self.get_object_cone(scene_object) for scene_object in scene_objects
+        ]
+
+        self.bins: list[list[list[int]]] = []
+        for tile_i in range(math.ceil(resolution_x / tile_size)):
+            row = []
+            for tile_j in range(math.ceil(resolution_y / tile_size)):
+                row.append(self.bin_tile(tile_i, tile_j, object_cones))
+            self.bins.append(row)
+
+    def get_candidates(self, i: int, j: int) -> list[int]:
+        """Get the indices of the objects that a primary ray through pixel (i, j)
+        can hit."""
+        return self.bins[i // self.tile_size][j // self.tile_size]
+
+    def get_window_point(self, a: float, b: float) -> Vector:
+        """
+        Get the point on the window at continuous pixel coordinates, where a goes
+        over rows and b over columns. The center of pixel (i, j) is at
+        (i + 0.5, j + 0.5), same as in the capture.
+        """
+        return (
+            self.camera.top_left
+            - (a * 2 * self.pixel_size_x * self.camera.up_unit)
+            + (b * 2 * self.pixel_size_y * self.camera.right_unit)
+        )
+
+    def get_object_cone(self, scene_object: SceneObject) -> tuple[Vector, float] | None:
+        """
+        Get the cone from the eye (unit axis and half angle) that contains the
+        object. Return None if the object can be seen in any direction.
+        """
+        bounding_sphere = scene_object.get_bounding_sphere()
+        if bounding_sphere is None:
+            return None
+        center, radius = bounding_sphere
+
+        to_center = center - self.camera.eye_position
+        distance = to_center.magnitude()
+        if distance <= radius:
+            # eye is inside the bounds
+            return None
+        return to_center.unit(), math.asin(radius / distance)
+
+    def get_tile_cone(self, tile_i: int, tile_j: int) -> tuple[Vector, float]:
+        """Get the cone from the eye (unit axis and half angle) that contains all
+        primary rays of a tile."""
+        # antialiasing samples reach past the centers of the border pixels
+        margin = FILTER_RADIUS / 2 if USE_ANTIALIASING else 0
+        first_row = tile_i * self.tile_size
+        last_row = min(first_row + self.tile_size, self.resolution_x) - 1
+        first_col = tile_j * self.tile_size
+        last_col = min(first_col + self.tile_size, self.resolution_y) - 1
+        a_min, a_max = first_row + 0.5 - margin, last_row + 0.5 + margin
+        b_min, b_max = first_col + 0.5 - margin, last_col + 0.5 + margin
+
+        eye = self.camera.eye_position
+        axis = (
+            self.get_window_point((a_min + a_max) / 2, (b_min + b_max) / 2) - eye
+        ).unit()
+        half_angle = 0.0
+        for a in (a_min, a_max):
+            for b in (b_min, b_max):
+                corner_direction = self.get_window_point(a, b) - eye
+                half_angle = max(half_angle, angle_between(axis, corner_direction))
+        return axis, half_angle
+
+    def bin_tile(
+        self,
+        tile_i: int,
+        tile_j: int,
+        object_cones: list[tuple[Vector, float] | None],
+    ) -> list[int]:
+        """Get the indices of the objects whose cones overlap the cone of a tile."""
+        axis, half_angle = self.get_tile_cone(tile_i, tile_j)
+        if half_angle >= math.pi / 2:
+            # the corners no longer bound the tile, keep everything
+            return list(range(len(object_cones)))
+
+        candidates = []
+        for ind, object_cone in enumerate(object_cones):
+            if object_cone is None:
+                candidates.append(ind)
+                continue
+            object_axis, object_half_angle = object_cone
+            if (
+                angle_between(axis, object_axis)
+                <= half_angle + object_half_angle + ANGLE_SLACK
+            ):
+                candidates.append(ind)
+        return candidates
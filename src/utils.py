@@ -1,14 +1,58 @@
 """Module with utilities."""
 
 import random
+import sys
+import threading
+
+# every thread gets its own random generator so threads do not share state
+_thread_local = threading.local()
+
+
+def get_rng() -> random.Random:
+    """Get the random generator of the current thread, creating it if needed."""
+    rng = getattr(_thread_local, "rng", None)
+    if rng is None:
+        rng = random.Random()
+        _thread_local.rng = rng
+    return rng
+
+
+def seed_rng(seed: int) -> None:
+    """Seed the random generator of the current thread."""
+    get_rng().seed(seed)
+
+
+def is_gil_enabled() -> bool:
+    """Check if the GIL is enabled, which is always the case before Python 3.13."""
+    is_gil_enabled_function = getattr(sys, "_is_gil_enabled", None)
+    if is_gil_enabled_function is None:
+        return True
+    return is_gil_enabled_function()
+
+
+class AtomicCounter:
+    """Counter that can be incremented from multiple threads."""
+
+    def __init__(self) -> None:
+        """Create a counter starting at 0."""
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def next(self) -> int:
+        """Get the current value and increment it."""
+        with self.lock:
+            value = self.value
+            self.value += 1
+        return value
 
 
 def get_random_point_on_unit_disk() -> tuple[float, float]:
     """Get a point on the unit disk with a uniform distribution."""
+    rng = get_rng()
     while True:
         # generate a point in unit square, reject if not in unit disc
-        x = 2 * random.random() - 1
-        y = 2 * random.random() - 1
+        x = 2 * rng.random() - 1
+        y = 2 * rng.random() - 1
         if x**2 + y**2 > 1:
             continue
         return x, y
@@ -17,3 +61,4 @@ def get_random_point_on_unit_disk() -> tuple[float, float]:
 if __name__ == "__main__":
     """Basic tests for the utils."""
     print(get_random_point_on_unit_disk())
+    print(is_gil_enabled())
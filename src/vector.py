@@ -1,9 +1,10 @@
 """Module containing vector class and relevant operations."""
 
 import math
-import random
 from typing import Self
 
+from src.utils import get_rng
+
 
 class Vector:
     """3D vector represented by 3 coordinates."""
@@ -68,6 +69,13 @@ def cross(v1: Vector, v2: Vector) -> Vector:
     )
 
 
+def angle_between(u: Vector, v: Vector) -> float:
+    """Angle between two vectors in radians."""
+    cosine = dot(u, v) / (u.magnitude() * v.magnitude())
+    # clamp to avoid domain errors from rounding
+    return math.acos(max(-1.0, min(1.0, cosine)))
+
+
 def elementwise_mult(u: Vector, v: Vector) -> Vector:
     """Element-wise multiplication of two vectors."""
     return Vector(u.x * v.x, u.y * v.y, u.z * v.z)
@@ -91,10 +99,11 @@ def random_vector_in_hemisphere(normal: Vector) -> Vector:
     """Pick random vectors uniformly in unit cube until one is found
     that is in the unit sphere and poining in same direction (same hemisphere as)
     the given vector."""
+    rng = get_rng()
     while True:
-        x = random.random() * 2 - 1
-        y = random.random() * 2 - 1
-        z = random.random() * 2 - 1
+        x = rng.random() * 2 - 1
+        y = rng.random() * 2 - 1
+        z = rng.random() * 2 - 1
         candidate = Vector(x, y, z)
         magnitude = candidate.magnitude()
         if magnitude > 1: